@@ -1,14 +1,37 @@
+import time
+# Taken before the other imports so --profile-startup also counts loading pygame and numpy
+startup_start = time.perf_counter()
+
 import sys
 import os
+import argparse
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'src')))
 from src.controller import SynthesizerAppController
+from src.model import AudioConfig
 
 def main():
         
+    parser = argparse.ArgumentParser(description="PySynth: Interactive Wavetable Synthesizer")
+    parser.add_argument("--profile-startup", action="store_true", help="print the time spent in each startup phase")
+    parser.add_argument("--sample-rate", type=int, default=44100, help="sample rate of the audio device in Hz")
+    parser.add_argument("--block-size", type=int, default=1024, help="mixer buffer size in samples")
+    parser.add_argument("--render-rate", type=int, default=None, help="rate waveforms are generated at before resampling to the device rate, e.g. 96000 for less aliasing on square and sawtooth waves; a rate below the device rate is not cheaper because resampling costs more than it saves")
+    parser.add_argument("--filter-zero-crossings", type=int, default=10, help="length of the resampling filter, fewer zero crossings use less CPU but let more aliasing through")
+    args = parser.parse_args()
+    if args.sample_rate <= 0:
+        parser.error("--sample-rate must be a positive number of Hz")
+    if args.render_rate is not None and args.render_rate <= 0:
+        parser.error("--render-rate must be a positive number of Hz")
+    if args.filter_zero_crossings <= 0:
+        parser.error("--filter-zero-crossings must be a positive number")
+    if args.block_size <= 0:
+        parser.error("--block-size must be a positive number of samples")
+    audio_config = AudioConfig(args.sample_rate, args.block_size, args.render_rate, args.filter_zero_crossings)
+
     #Creates an instance of Synthesizer App Controller
     #Mainloop is called
-    app =  SynthesizerAppController()
+    app =  SynthesizerAppController(profile_startup=args.profile_startup, audio_config=audio_config, startup_start=startup_start)
     app.run_synth()
 
 if __name__ == '__main__':
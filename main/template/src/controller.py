@@ -1,14 +1,31 @@
+import os
+import threading
+import time
 import pygame
 import numpy as np
 from .view import WaveformVisualizer, Slider, Display
-from .model import MidiProcessor
+from .model import MidiProcessor, AudioConfig
 
 class SynthesizerAppController:
-    def __init__(self):
+    def __init__(self, profile_startup=False, audio_config=None, startup_start=None):
         """"
         Initialization function for the controller class  
         """
-        pygame.init()
+        self.audio_config = audio_config if audio_config is not None else AudioConfig()
+        self.profile_startup = profile_startup
+        self.startup_phases = []
+        # main.py passes the time it started at, so everything before the controller counts as one phase
+        if startup_start is not None:
+            self.phase_start = startup_start
+            self.mark_startup_phase("imports and arguments")
+        else:
+            self.phase_start = time.perf_counter()
+
+        # Only bring up the subsystems needed for the first frame, the mixer is started by AudioPlayback on the first note
+        pygame.display.init()
+        pygame.font.init()
+        self.mark_startup_phase("pygame subsystems")
+
         # Screen dimensions
         self.screen_width = 800
         self.screen_height = 1000
@@ -19,32 +36,85 @@ class SynthesizerAppController:
         self.screen = pygame.display.set_mode((self.screen_width, self.screen_height))
         self.display = Display(self.screen)
         pygame.display.set_caption("Synthesizer Interface")
+        self.mark_startup_phase("window and font")
+
+        # Load and scale the piano image in the background while the tutorial screen is shown
+        self.asset_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "assets")
+        self.piano_image = None
+        self.piano_rect = None
+        self.asset_load_time = None
+        self.asset_error = None
+        self.asset_loader = threading.Thread(target=self.load_assets, daemon=True)
+        self.asset_loader.start()
         
         # Initialize the processor
-        self.processor = MidiProcessor()
+        self.processor = MidiProcessor(self.audio_config)
         self.key_to_note = self.processor.key_to_note
         self.note_to_index = {note: i for i, note in enumerate(self.key_to_note.values())}
 
+        # Sample bank for the sampler wave type, the test tone is an A4 (MIDI 69)
+        sample_directory = os.path.join(self.asset_directory, "Waveform Sound Test")
+        self.processor.load_sample_bank(sample_directory, root_note=69)
+        self.mark_startup_phase("processor and sample bank")
+
         # Define sliders
-        self.wavetype_slider = Slider(slider_x, 30, slider_width, 20, 0, 4, 0, "Wave Type")
+        self.wavetype_slider = Slider(slider_x, 30, slider_width, 20, 0, 5, 0, "Wave Type")
         self.frequency_slider = Slider(slider_x, 80, slider_width, 20, 20, 2000, 440, "Frequency")
         self.amplitude_slider = Slider(slider_x, 130, slider_width, 20,-1000, 1000, 0.2, "Volume")
         self.duration_slider = Slider(slider_x, 180, slider_width, 20,0.01, 2, 0.5, "Duration")
         self.global_volume_slider = Slider(slider_x, 230, slider_width, 20, 0, 1, 0.2, "Global Volume")
+        self.mark_startup_phase("sliders")
+
+    def load_assets(self):
+        """"
+        Runs on the asset loader thread so image decoding doesn't hold up the first frame
+        """
+        load_start = time.perf_counter()
+        image_path = os.path.join(self.asset_directory, "Pixel Piano 1.0 Sprite", "88 Keys Pianos", "Piano1.png")
+        try:
+            piano_image = pygame.transform.scale(pygame.image.load(image_path), (600, 200))
+        except (pygame.error, OSError) as e:
+            # Exceptions don't leave the thread, so keep it to be raised once run_synth joins the loader
+            self.asset_error = e
+            return
+        self.piano_rect = piano_image.get_rect(center=(self.screen_width // 2, self.screen_height - 300))
+        self.piano_image = piano_image
+        self.asset_load_time = time.perf_counter() - load_start
+
+    def mark_startup_phase(self, name):
+        now = time.perf_counter()
+        self.startup_phases.append((name, now - self.phase_start))
+        self.phase_start = now
+
+    def print_startup_report(self):
+        """"
+        Prints the time spent in each startup phase for --profile-startup
+        """
+        print("Startup profile:")
+        for name, seconds in self.startup_phases:
+            print(f"  {name:<28}{seconds * 1000:8.1f} ms")
+        print(f"  {'time to first frame':<28}{sum(seconds for _, seconds in self.startup_phases) * 1000:8.1f} ms")
+        if self.asset_error is not None:
+            print(f"  {'assets (background)':<28}{'failed':>8}")
+        elif self.asset_load_time is None:
+            print(f"  {'assets (background)':<28}{'loading':>8}")
+        else:
+            print(f"  {'assets (background)':<28}{self.asset_load_time * 1000:8.1f} ms")
 
-        # Load and scale the piano image
-        image_path = "/Users/jnaran/Documents/FinalProject/main/template/assets/Pixel Piano 1.0 Sprite/88 Keys Pianos/Piano1.png"
-        self.piano_image = pygame.image.load(image_path)
-        self.piano_image = pygame.transform.scale(self.piano_image, (600, 200))
-        self.piano_rect = self.piano_image.get_rect(center=(self.screen_width // 2, self.screen_height - 300))
-        
     def run_synth(self):
         """"
         Main loop for our Pygame Program
         """
         running = True
-        generated_waveform = np.zeros(41000)
-        self.display.display_tutorial_message()
+        generated_waveform = self.audio_config.silence()
+        self.display.draw_tutorial_message()
+        self.mark_startup_phase("tutorial frame")
+        if self.profile_startup:
+            self.print_startup_report()
+        self.display.wait_for_key()
+        self.asset_loader.join()
+        if self.asset_error is not None:
+            raise self.asset_error
         while running:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
@@ -62,7 +132,7 @@ class SynthesizerAppController:
                     slider.handle_event(event)
 
             # Get and set synthesizer parameters from sliders
-            wave_type = ['sine', 'square', 'triangle', 'sawtooth'][int(self.wavetype_slider.value)]
+            wave_type = ['sine', 'square', 'triangle', 'sawtooth', 'sampler'][int(self.wavetype_slider.value)]
             frequency = self.frequency_slider.value
             amplitude = self.amplitude_slider.value
             duration = self.duration_slider.value
@@ -84,7 +154,7 @@ class SynthesizerAppController:
             visualizer_rect = pygame.Rect(50, 400, 700, 200)
             pygame.draw.rect(self.screen, (0, 0, 0), visualizer_rect)  # Black background for waveform area
 
-            WaveformVisualizer.visualize_waveform_pygame(self.screen.subsurface(visualizer_rect), generated_waveform)
+            WaveformVisualizer.visualize_waveform_pygame(self.screen.subsurface(visualizer_rect), generated_waveform, self.audio_config.sample_rate, self.audio_config.block_size)
 
             pygame.display.flip()
 
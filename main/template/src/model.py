@@ -1,7 +1,87 @@
+import os
+from fractions import Fraction
 import numpy as np
 import pygame
 from view import AudioPlayback
 
+class AudioConfig:
+    """
+    Sample rate and block size shared by the model, the mixer and the visualizer, with an optional internal render rate
+    """
+    def __init__(self, sample_rate=44100, block_size=1024, render_rate=None, filter_zero_crossings=10):
+        #sample_rate is what the audio device plays, render_rate is what waveforms are generated at before resampling
+        #A high render rate (e.g. 96000) keeps more detail on sharp waveforms, the built-in voices are cheap enough that a
+        #lower one doesn't save CPU once resampling is paid for, filter_zero_crossings is what trades resampling cost for quality
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.render_rate = render_rate if render_rate is not None else sample_rate
+        self.filter_zero_crossings = filter_zero_crossings
+        ratio = Fraction(self.sample_rate, self.render_rate)
+        self.up = ratio.numerator
+        self.down = ratio.denominator
+        self.polyphase_filter = None
+        self.cached_plan = None
+
+    def silence(self):
+        # One block of stereo silence, used when no keys are held
+        return np.zeros((self.block_size, 2))
+
+    def design_polyphase_filter(self):
+        """
+        Kaiser windowed-sinc low pass at the lower of the two Nyquist rates, split into one row of taps per phase
+        """
+        factor = max(self.up, self.down)
+        cutoff = 0.5 / factor
+        half_length = self.filter_zero_crossings * factor
+        m = np.arange(-half_length, half_length + 1)
+        taps = 2 * cutoff * np.sinc(2 * cutoff * m) * np.kaiser(len(m), 8.0) * self.up
+        #Pad so every phase gets the same number of taps, the zeros go after the centre so the delay is unchanged
+        taps = np.concatenate((taps, np.zeros(-len(taps) % self.up)))
+        return taps.reshape(-1, self.up).T, half_length
+
+    def resample_plan(self, input_length):
+        """
+        Works out which input window and filter phase each output sample uses, cached because every frame renders the same length
+        """
+        if self.cached_plan is not None and self.cached_plan[0] == input_length:
+            return self.cached_plan[1]
+        phases, delay = self.polyphase_filter
+        output_length = -(-input_length * self.up // self.down)
+        plan = []
+        #Outputs that share a phase are up samples apart and their input windows are down samples apart,
+        #so each phase is one strided slice of the input windows and one matrix product
+        for first_output in range(min(self.up, output_length)):
+            position = first_output * self.down + delay
+            count = len(range(first_output, output_length, self.up))
+            plan.append((first_output, position // self.up + 1, count, phases[position % self.up, ::-1].copy()))
+        self.cached_plan = (input_length, (output_length, plan))
+        return self.cached_plan[1]
+
+    def resample(self, waveform):
+        """
+        Converts a waveform from the render rate to the device rate with a vectorized polyphase filter
+        """
+        if self.up == self.down:
+            return waveform
+        if self.polyphase_filter is None:
+            self.polyphase_filter = self.design_polyphase_filter()
+        taps_per_phase = self.polyphase_filter[0].shape[1]
+
+        mono = waveform.ndim == 1
+        frames = waveform[np.newaxis, :] if mono else waveform.T
+        output_length, plan = self.resample_plan(frames.shape[1])
+
+        #Channels first, with zero padding on both sides so the tap windows can run past the ends of the waveform
+        padded = np.zeros((frames.shape[0], frames.shape[1] + 2 * taps_per_phase))
+        padded[:, taps_per_phase:-taps_per_phase] = frames
+        #A strided view of every window of taps_per_phase input frames, nothing is copied
+        windows = np.lib.stride_tricks.sliding_window_view(padded, taps_per_phase, axis=1)
+        resampled = np.empty((output_length, frames.shape[0]))
+        for first_output, first_window, count, taps in plan:
+            resampled[first_output::self.up] = (windows[:, first_window:first_window + (count - 1) * self.down + 1:self.down] @ taps).T
+        return resampled[:, 0] if mono else resampled
+
+
 #Model class handling the basic generation and parameters of a waveform
 class GenerateWaveform:
      #Class to generate different Wave Forms based on parameters
@@ -30,16 +110,20 @@ class GenerateWaveform:
         #Generaters a sawtooth wwave
         return self.amplitude * (2 * (self.time * self.frequency % 1) - 1)
         
-    def generate_waveform(self,wave_type):
-        """"
-        Method used to update wavetype arguments at runtime
-        """
-        waveforms = {
+    def wave_types(self):
+        # Maps each wave type name to the method that generates it, subclasses add their own voices here
+        return {
         "sine": self.sine_wave,
         "triangle": self.triangle_wave,
         "square": self.square_wave,
         "sawtooth": self.sawtooth_wave
         }
+
+    def generate_waveform(self,wave_type):
+        """"
+        Method used to update wavetype arguments at runtime
+        """
+        waveforms = self.wave_types()
         if wave_type not in waveforms:
             raise ValueError(f"Unsupported Wave Type {wave_type}")
         waveform = waveforms[wave_type]()
@@ -58,14 +142,182 @@ class GenerateWaveform:
         sound = pygame.sndarray.make_sound(waveform_int16)
         return sound
     
+class SampleBank:
+    """
+    Folder of WAV samples that are memory-mapped on first use, so startup time and memory don't grow with the size of the bank
+    """
+    #numpy dtypes for the PCM sample widths that can be mapped directly from disk, 24 bit is mapped as raw bytes
+    pcm_dtypes = {1: np.uint8, 2: np.dtype("<i2"), 3: np.uint8, 4: np.dtype("<i4")}
+    #WAVE_FORMAT_EXTENSIBLE keeps the real format in the first two bytes of its subformat GUID
+    extensible_format = 0xFFFE
+
+    def __init__(self, directory, root_note=60):
+        #Only the WAV headers are read here, the audio data itself stays on disk until a sample is played
+        self.directory = directory
+        self.root_note = root_note
+        self.paths = {}
+        self.headers = {}
+        for file_name in sorted(os.listdir(directory)):
+            name, extension = os.path.splitext(file_name)
+            if extension.lower() != ".wav":
+                continue
+            path = os.path.join(directory, file_name)
+            try:
+                header = self.read_header(path)
+                self.sample_layout(path, header[0], header[3])
+            except (ValueError, OSError) as e:
+                print(f"Sample bank error, skipping {file_name}: {e}")
+                continue
+            self.paths[name] = path
+            self.headers[name] = header
+        self.samples = {}
+
+    def names(self):
+        return list(self.paths)
+
+    def get_sample(self, name):
+        """
+        Returns the (data, sample_rate, (scale, offset)) of a sample, memory-mapping the WAV file the first time it is requested
+        """
+        if name not in self.paths:
+            raise ValueError(f"Unknown Sample {name}")
+        if name not in self.samples:
+            self.samples[name] = self.load_wav(name)
+        return self.samples[name]
+
+    def read_frames(self, name, index):
+        """
+        Reads the frames at the given indices of a sample as floats in -1 to 1
+        """
+        data, _, (scale, offset) = self.get_sample(name)
+        frames = data[index]
+        if frames.ndim == 3:
+            # 24 bit frames come in as 3 little endian bytes, shifting up to the top of an int32 and back down sign-extends them
+            frames = (frames[..., 0].astype(np.int32) << 8 | frames[..., 1].astype(np.int32) << 16 | frames[..., 2].astype(np.int32) << 24) >> 8
+        return (frames.astype(np.float64) - offset) * scale
+
+    def read_header(self, path):
+        """
+        Walks the RIFF chunks of a WAV file and returns its format and where its data chunk starts
+        """
+        with open(path, "rb") as wav_file:
+            header = wav_file.read(12)
+            if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+                raise ValueError(f"Not a WAV file {path}")
+            audio_format = channels = sample_rate = sample_width = None
+            while True:
+                chunk_header = wav_file.read(8)
+                if len(chunk_header) < 8:
+                    raise ValueError(f"WAV file has no data chunk {path}")
+                chunk_id = chunk_header[:4]
+                chunk_size = int.from_bytes(chunk_header[4:], "little")
+                if chunk_id == b"fmt ":
+                    fmt = wav_file.read(chunk_size)
+                    audio_format = int.from_bytes(fmt[0:2], "little")
+                    channels = int.from_bytes(fmt[2:4], "little")
+                    sample_rate = int.from_bytes(fmt[4:8], "little")
+                    sample_width = int.from_bytes(fmt[14:16], "little") // 8
+                    if audio_format == self.extensible_format and len(fmt) >= 26:
+                        audio_format = int.from_bytes(fmt[24:26], "little")
+                    if chunk_size % 2:
+                        wav_file.seek(1, os.SEEK_CUR)
+                elif chunk_id == b"data":
+                    data_offset = wav_file.tell()
+                    break
+                else:
+                    #Chunks are padded to an even number of bytes
+                    wav_file.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+        if audio_format is None:
+            raise ValueError(f"WAV file has no fmt chunk {path}")
+        if channels < 1 or sample_rate < 1:
+            raise ValueError(f"WAV file has {channels} channels at {sample_rate} Hz {path}")
+        data_size = min(chunk_size, os.path.getsize(path) - data_offset)
+        return audio_format, channels, sample_rate, sample_width, data_offset, data_size
+
+    def sample_layout(self, path, audio_format, sample_width):
+        """
+        Returns the numpy dtype, scale and offset that turn a WAV file's samples into floats in -1 to 1
+        """
+        if audio_format == 3 and sample_width == 4:
+            return np.dtype("<f4"), 1.0, 0.0
+        if audio_format == 1 and sample_width in self.pcm_dtypes:
+            #8 bit WAV is unsigned, every other PCM width is signed
+            offset = 128.0 if sample_width == 1 else 0.0
+            return self.pcm_dtypes[sample_width], 1.0 / (2 ** (8 * sample_width - 1)), offset
+        raise ValueError(f"Unsupported WAV format {audio_format} with {sample_width * 8} bit samples {path}")
+
+    def load_wav(self, name):
+        """
+        Maps the data chunk of a sample with np.memmap instead of reading it into memory
+        """
+        path = self.paths[name]
+        audio_format, channels, sample_rate, sample_width, data_offset, data_size = self.headers[name]
+        dtype, scale, offset = self.sample_layout(path, audio_format, sample_width)
+        frames = data_size // (sample_width * channels)
+        shape = (frames, channels, 3) if sample_width == 3 else (frames, channels)
+        data = np.memmap(path, dtype=dtype, mode="r", offset=data_offset, shape=shape)
+        return data, sample_rate, (scale, offset)
+
+
+class SampleWaveform(GenerateWaveform):
+    """
+    Adds a "sampler" wave type that plays a looped sample from a SampleBank, resampled relative to the bank's root note
+    """
+    def __init__(self, frequency, amplitude=0.5, duration=0.5, sample_rate=44100, sample_bank=None, sample_name=None):
+        super().__init__(frequency, amplitude, duration, sample_rate)
+        self.sample_bank = sample_bank
+        self.sample_name = sample_name
+
+    def sampler_wave(self):
+        """
+        Pitch-shifts the sample with vectorized linear interpolation, only the frames that are read are paged in from disk
+        """
+        if self.sample_bank is None or self.sample_name is None:
+            return np.zeros(self.samples)  # Without a loaded sample the sampler plays silence
+        data, source_rate, _ = self.sample_bank.get_sample(self.sample_name)
+        length = len(data)
+        if length == 0 or self.frequency <= 0:
+            return np.zeros(self.samples)
+
+        #Step through the sample faster or slower than real time to reach the requested pitch
+        root_frequency = 440.0 * 2**((self.sample_bank.root_note - 69) / 12.0)
+        step = (self.frequency / root_frequency) * (source_rate / self.sample_rate)
+        positions = np.arange(self.samples) * step % length
+        index = positions.astype(np.int64)
+        fraction = (positions - index)[:, np.newaxis]
+        next_index = (index + 1) % length  # Wrap around to loop the sample
+
+        current = self.sample_bank.read_frames(self.sample_name, index)
+        upcoming = self.sample_bank.read_frames(self.sample_name, next_index)
+        waveform = current + fraction * (upcoming - current)
+        return self.amplitude * waveform
+
+    def wave_types(self):
+        waveforms = super().wave_types()
+        waveforms["sampler"] = self.sampler_wave
+        return waveforms
+
+    def convert_to_stereo(self, waveform):
+        # Samples can already have channels, stereo ones are kept and anything wider is mixed down to mono first
+        if waveform.ndim == 2:
+            if waveform.shape[1] == 2:
+                return waveform
+            waveform = waveform[:, 0] if waveform.shape[1] == 1 else waveform.mean(axis=1)
+        return super().convert_to_stereo(waveform)
+
+
 class MidiProcessor:
-    def __init__(self):
+    def __init__(self, audio_config=None):
+        self.audio_config = audio_config if audio_config is not None else AudioConfig()
         self.active_keys = set()
         self.wave_type = "sine"
         self.amplitude = 0.2
         self.duration = 0.5
         self.frequency = 440
         self.waveform = None
+        self.sample_bank = None
+        self.sample_name = None
         self.key_to_note = {pygame.K_a: 60, pygame.K_s: 62, pygame.K_d: 64, pygame.K_f: 65, pygame.K_g: 67, pygame.K_h: 69, pygame.K_j: 71, pygame.K_k: 72}
         self.key_to_name = {
             pygame.K_a: "C4",  # MIDI 60
@@ -86,30 +338,55 @@ class MidiProcessor:
         self.generate_waveform()
 
     def generate_waveform(self):
-        self.waveform = GenerateWaveform(self.frequency, self.amplitude)
+        self.waveform = GenerateWaveform(self.frequency, self.amplitude, sample_rate=self.audio_config.render_rate)
+
+    def load_sample_bank(self, directory, root_note=60, sample_name=None):
+        """
+        Sets the bank used by the "sampler" wave type, the first sample in the folder is used unless one is named
+        """
+        #The sampler is optional, so a missing folder only leaves it silent instead of stopping the program
+        try:
+            self.sample_bank = SampleBank(directory, root_note)
+        except OSError as e:
+            print(f"Sample bank error: {e}")
+            self.sample_bank = None
+            self.sample_name = None
+            return
+        names = self.sample_bank.names()
+        if not names:
+            print(f"Sample bank error: no playable WAV files in {directory}")
+        self.sample_name = sample_name if sample_name is not None else (names[0] if names else None)
+
+    def create_generator(self, frequency):
+        if self.wave_type == "sampler":
+            return SampleWaveform(frequency, self.amplitude, self.duration, self.audio_config.render_rate, self.sample_bank, self.sample_name)
+        return GenerateWaveform(frequency, self.amplitude, self.duration, self.audio_config.render_rate)
 
     def play_notes(self, global_volume=0.2):
         """
         Function dedicated to taking in user input data, converting them into midi notes, and passing the corresponding data to the waveform
         """
         if not self.active_keys:
-            return np.zeros(41000)  # Return silence if no keys are active
+            return self.audio_config.silence()  # Return silence if no keys are active
 
         waveforms = []
         for key in self.active_keys:
             note = self.key_to_note.get(key, None)
             frequency = self.midi_to_frequency(note) if note else 0
-            generator = GenerateWaveform(frequency, self.amplitude, self.duration)
+            generator = self.create_generator(frequency)
             waveform = generator.generate_waveform(self.wave_type)
             waveforms.append(waveform)
 
         combined_waveform = np.sum(waveforms, axis=0)
+        # Waveforms are generated at the render rate, the mixer plays at the device rate
+        # Resampling before normalizing keeps the filter's ringing on sharp edges inside full scale
+        combined_waveform = self.audio_config.resample(combined_waveform)
 
         if np.max(np.abs(combined_waveform)) > 0:
             combined_waveform /= np.max(np.abs(combined_waveform))  # Normalize
 
         combined_waveform *= global_volume
-        player = AudioPlayback(combined_waveform, global_volume)
+        player = AudioPlayback(combined_waveform, global_volume, self.audio_config.sample_rate, self.audio_config.block_size)
         player.play_waveform()  # Play the audio
         
         return combined_waveform
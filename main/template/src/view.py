@@ -1,22 +1,38 @@
 import pygame 
 import numpy as np
 
+# SysFont scans the system font list on every call, so each font is only created once and shared between widgets
+_font_cache = {}
+
+def get_font(name="Arial", size=24):
+    key = (name, size)
+    if key not in _font_cache:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        _font_cache[key] = pygame.font.SysFont(name, size)
+    return _font_cache[key]
+
 class AudioPlayback:
     """
     Instantiates Pygame's Mixer and plays the updataed sound from 
     """
-    def __init__(self, waveform, global_volume):
+    def __init__(self, waveform, global_volume, sample_rate=44100, block_size=1024):
         self.waveform = waveform
         self.global_volume = global_volume
-        self.sample_rate = 44100
+        self.sample_rate = sample_rate
+        self.block_size = block_size
 
     def play_waveform(self):
-        # Convert waveform to 16-bit PCM format
-        waveform_int16 = np.int16(self.waveform * 32767)
+        # Convert waveform to 16-bit PCM format, clipping first so anything past full scale can't wrap around
+        waveform_int16 = np.int16(np.clip(self.waveform, -1, 1) * 32767)
         
         # Initialize pygame mixer
         try:
-            pygame.mixer.init(frequency=self.sample_rate,size=-16,channels=2)
+            # Restart a mixer that was opened with other settings, otherwise every note would play at the wrong pitch
+            if pygame.mixer.get_init() not in (None, (self.sample_rate, -16, 2)):
+                pygame.mixer.quit()
+            # allowedchanges=0 makes SDL convert to the device's rate instead of opening it at a different one
+            pygame.mixer.init(frequency=self.sample_rate,size=-16,channels=2,buffer=self.block_size,allowedchanges=0)
         except pygame.error as e:
             print(f"Pygame mixer error: {e}")
         
@@ -28,7 +44,7 @@ class AudioPlayback:
 
 class WaveformVisualizer:
     @staticmethod
-    def visualize_waveform_pygame(screen, waveform, sampling_rate=41000, window_size=1024):
+    def visualize_waveform_pygame(screen, waveform, sampling_rate=44100, window_size=1024):
         screen.fill((30, 30, 30))  # Dark grey background
 
         width, height = screen.get_size()
@@ -64,11 +80,15 @@ class Display:
     def __init__(self, screen):
         self.screen = screen
         self.processor = None  # Create an empty variable to lazy import MidiProcesso
-        self.font = pygame.font.SysFont("Arial", 24)
+        self.font = get_font("Arial", 24)
     def set_processor(self,processor):
         self.processor = processor
 
     def display_tutorial_message(self):
+        self.draw_tutorial_message()
+        self.wait_for_key()
+
+    def draw_tutorial_message(self):
         # Tutorial message
         tutorial_text = [
             "Welcome to the Synthesizer Program!",
@@ -90,6 +110,7 @@ class Display:
 
         pygame.display.flip()  # Update the display
 
+    def wait_for_key(self):
         # Wait for a key press to continue
         waiting = True
         while waiting:
@@ -125,7 +146,7 @@ class Slider:
         self.min_value = min_value
         self.max_value = max_value
         self.value = initial_value
-        self.font = pygame.font.SysFont("Arial", 24)
+        self.font = get_font("Arial", 24)
         self.label = label
         self.dragging = False
 
@@ -142,7 +163,7 @@ class Slider:
         label_pos = self.rect.x - 175
         screen.blit(label, (label_pos, self.rect.y))
         if self.label == "Wave Type":
-            wave_names = ["Sine", "Square", "Triangle", "Sawtooth"]
+            wave_names = ["Sine", "Square", "Triangle", "Sawtooth", "Sampler"]
             
             # Round and clamp the value to prevent out-of-range errors
             index = max(0, min(round(self.value), len(wave_names) - 1))